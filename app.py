@@ -1,21 +1,22 @@
 import streamlit as st
 import asyncio
-from instagram_bot import InstagramBot, console, logger, GROQ_API_KEY
+import threading
+import weakref
+from instagram_bot import InstagramBot, console, logger, GROQ_API_KEY, close_http_session, _safe_unlink
 from rich.panel import Panel
 from typing import Tuple
 from pathlib import Path
 import logging
-import nest_asyncio
 import time
 
-# Enable nested async loops (needed for Streamlit)
-nest_asyncio.apply()
+try:
+    import uvloop
+except ImportError:  # uvloop is POSIX-only
+    uvloop = None
 
 class StreamlitInstagramBot:
     def __init__(self):
         self.bot = InstagramBot()
-        if 'logged_in' not in st.session_state:
-            st.session_state.logged_in = False
 
     async def handle_login(self):
         """Handle the login process"""
@@ -81,12 +82,21 @@ class StreamlitInstagramBot:
             prompt = st.text_area("What would you like to post about?", value=st.session_state.prompt)
             st.session_state.prompt = prompt
 
-            # Generate button
-            if st.button("Generate Post") and prompt:
+            # Generate buttons; Regenerate moves this prompt to a new version for this session only
+            if 'generations' not in st.session_state:
+                st.session_state.generations = {}
+            generate = st.button("Generate Post")
+            regenerate = st.session_state.generated_content is not None and st.button("Regenerate")
+            if (generate or regenerate) and prompt:
+                if regenerate:
+                    st.session_state.generations[prompt] = st.session_state.generations.get(prompt, 0) + 1
+                generation = st.session_state.generations.get(prompt, 0)
                 with st.spinner("Creating AI post..."):
                     try:
-                        success, image_path, caption = await self.bot.create_ai_post(prompt)
+                        success, image_path, caption = await self.bot.create_ai_post(prompt, generation)
                         if success and image_path and caption:
+                            if st.session_state.generated_content:
+                                _safe_unlink(st.session_state.generated_content['image_path'])
                             st.session_state.generated_content = {
                                 'image_path': image_path,
                                 'caption': caption
@@ -117,14 +127,12 @@ class StreamlitInstagramBot:
                 with col3:
                     if st.button("Post Content"):
                         try:
-                            self.bot.client.photo_upload(
+                            await self.bot.upload_photo(
                                 st.session_state.generated_content['image_path'],
                                 st.session_state.generated_content['caption']
                             )
                             # Clean up
-                            import os
-                            if os.path.exists(st.session_state.generated_content['image_path']):
-                                os.unlink(st.session_state.generated_content['image_path'])
+                            _safe_unlink(st.session_state.generated_content['image_path'])
                             
                             # Reset session state
                             st.session_state.generated_content = None
@@ -140,9 +148,7 @@ class StreamlitInstagramBot:
                     if st.button("Cancel"):
                         try:
                             # Clean up
-                            import os
-                            if os.path.exists(st.session_state.generated_content['image_path']):
-                                os.unlink(st.session_state.generated_content['image_path'])
+                            _safe_unlink(st.session_state.generated_content['image_path'])
                             
                             # Reset session state
                             st.session_state.generated_content = None
@@ -187,6 +193,23 @@ class StreamlitInstagramBot:
                         else:
                             st.error("Failed to send message.")
 
+        elif message_type == "Bulk Messages":
+            with st.form("bulk_dm_form"):
+                usernames = st.text_area("Recipients (one username per line)")
+                message = st.text_area("Your message")
+                submit = st.form_submit_button("Send Messages")
+
+                recipients = [u.strip() for u in usernames.splitlines() if u.strip()]
+                if submit and recipients and message:
+                    with st.spinner("Sending messages..."):
+                        results = await self.bot.send_dms([(u, message) for u in recipients])
+                        sent = sum(results)
+                        if sent == len(recipients):
+                            st.success(f"Sent {sent} messages successfully!")
+                        else:
+                            failed = [u for u, ok in zip(recipients, results) if not ok]
+                            st.error(f"Sent {sent}/{len(recipients)} messages. Failed: {', '.join(failed)}")
+
     async def handle_interactions(self):
         """Handle user interactions"""
         st.subheader("Interactions")
@@ -207,6 +230,48 @@ class StreamlitInstagramBot:
                         else:
                             st.error("Failed to like post.")
 
+def _close_session_loop(loop: asyncio.AbstractEventLoop):
+    # Usually runs on Streamlit's server thread, whose own loop is already running,
+    # so the loop is driven to shutdown from a fresh thread
+    def close():
+        loop.run_until_complete(close_http_session())
+        loop.close()
+
+    threading.Thread(target=close, daemon=True).start()
+
+class SessionLoop:
+    """Owns one browser session's event loop.
+
+    Streamlit has no session-end hook, so when the session state holding this
+    object is dropped, the loop's pooled HTTP session and the loop are closed.
+    """
+
+    def __init__(self):
+        self.loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+        # Loops still alive at exit are closed by instagram_bot's atexit hook
+        weakref.finalize(self, _close_session_loop, self.loop).atexit = False
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return this session's event loop, creating it on first use"""
+    if 'event_loop' not in st.session_state:
+        st.session_state.event_loop = SessionLoop()
+    loop = st.session_state.event_loop.loop
+    # Reruns may land on a different script thread, so bind the loop every time
+    asyncio.set_event_loop(loop)
+    return loop
+
+def get_bot() -> StreamlitInstagramBot:
+    """Return this session's bot, creating it on first use.
+
+    The bot carries the Instagram login, so it is kept per session rather than
+    shared through st.cache_resource; only account-free resources like the Groq
+    client are shared across sessions. Reruns find it in session_state, so it
+    is built once per session, never per rerun.
+    """
+    if 'bot' not in st.session_state:
+        st.session_state.bot = StreamlitInstagramBot()
+    return st.session_state.bot
+
 async def main():
     # Set page config
     st.set_page_config(
@@ -216,8 +281,9 @@ async def main():
     )
 
     # Initialize bot
-    if 'bot' not in st.session_state:
-        st.session_state.bot = StreamlitInstagramBot()
+    bot = get_bot()
+    if 'logged_in' not in st.session_state:
+        st.session_state.logged_in = False
 
     # Title
     st.title("Instagram AI Assistant")
@@ -235,13 +301,13 @@ async def main():
 
     # Handle navigation
     if nav_selection == "Login":
-        await st.session_state.bot.handle_login()
+        await bot.handle_login()
     elif nav_selection == "Posting":
-        await st.session_state.bot.handle_posting()
+        await bot.handle_posting()
     elif nav_selection == "Messaging":
-        await st.session_state.bot.handle_messaging()
+        await bot.handle_messaging()
     elif nav_selection == "Interactions":
-        await st.session_state.bot.handle_interactions()
+        await bot.handle_interactions()
     elif nav_selection == "Settings":
         st.info("Settings feature coming soon!")
 
@@ -250,10 +316,11 @@ if __name__ == "__main__":
     for directory in ['logs', 'sessions']:
         Path(directory).mkdir(exist_ok=True)
         
-    # Set debug logging
+    # Configure logging here rather than on import, then enable debug output for the bot
+    logging.basicConfig(level=logging.INFO)
     logging.getLogger('instagram_bot').setLevel(logging.DEBUG)
     
     if not GROQ_API_KEY:
         st.error("Please set GROQ_API_KEY in your .env file")
     else:
-        asyncio.run(main())
\ No newline at end of file
+        get_event_loop().run_until_complete(main())
\ No newline at end of file
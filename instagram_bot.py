@@ -1,6 +1,10 @@
 import asyncio
+import multiprocessing
+import atexit
 import os
-from typing import Optional, Tuple, Dict
+import threading
+import time
+from typing import Optional, Tuple, Dict, List, Callable, Awaitable, Any
 from instagrapi import Client
 from dotenv import load_dotenv
 import questionary
@@ -10,246 +14,530 @@ from rich import print as rprint
 from rich.table import Table
 import logging
 from pathlib import Path
-import requests
-from groq import AsyncGroq
+import aiohttp
+from groq import Groq
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import urllib.parse
 import tempfile
+import shutil
 from PIL import Image
 from io import BytesIO
-import json
+import orjson
 import re
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Rich console and logging
+# Initialize Rich console and logger; logging itself is configured by the entry point.
+# Console output follows the bot logger's level: progress traces need DEBUG, success
+# messages INFO (the default set here, so callers see them unless they opt out),
+# and failures are always printed
 console = Console()
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('instagram_bot')
-
-# Initialize Groq client
+logger.setLevel(logging.INFO)
+
+def _safe_unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def _write_file_atomic(path: str, data: bytes):
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), delete=False) as temp_file:
+        temp_file.write(data)
+    try:
+        os.replace(temp_file.name, path)
+    except BaseException:
+        _safe_unlink(temp_file.name)
+        raise
+
+# Groq client is shared across Streamlit reruns and sessions so its HTTP pool is reused
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
-groq_client = AsyncGroq(api_key=GROQ_API_KEY)
+
+@st.cache_resource
+def get_groq_client() -> Groq:
+    return Groq(api_key=GROQ_API_KEY)
+
+CONTENT_SYSTEM_PROMPT = """Create Instagram content. Respond with JSON only:
+            {
+                "caption": "Instagram caption with hashtags",
+                "image_prompt": "detailed image generation prompt"
+            }"""
+
+# Markdown code fences Groq sometimes wraps around its JSON reply
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```\s*$", re.M)
+
+# Keyed by prompt and the caller's regeneration count for it, so asking for a new
+# version moves onto a fresh entry; failed calls raise and are not cached
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def _generate_content_cached(prompt: str, generation: int) -> Tuple[str, str]:
+    response = get_groq_client().chat.completions.create(
+        messages=[
+            {"role": "system", "content": CONTENT_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        model="meta-llama/llama-4-scout-17b-16e-instruct"
+    )
+
+    response_text = _FENCE_RE.sub("", response.choices[0].message.content).strip()
+
+    content = orjson.loads(response_text)
+    return content["caption"], content["image_prompt"]
+
+async def _to_thread_with_script_ctx(func: Callable, *args) -> Any:
+    """asyncio.to_thread that carries the Streamlit ScriptRunContext into the worker
+    thread, so st.cache_* calls made there don't warn about a missing context"""
+    ctx = get_script_run_ctx()
+
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func(*args)
+
+    return await asyncio.to_thread(run)
+
+# Generated images are memoized on disk by prompt hash so they survive reruns and restarts;
+# entries expire a day after download and the least recently used go first when full
+IMAGE_CACHE_DIR = Path('cache')
+IMAGE_CACHE_MAX_ENTRIES = 128
+IMAGE_CACHE_TTL = 86400
+# Instagram feed images top out at 1080px, anything larger is wasted upload bandwidth
+UPLOAD_MAX_SIZE = (1080, 1080)
+
+# One pooled HTTP session per event loop (each Streamlit session runs its own loop),
+# so image fetches reuse kept-alive TLS connections instead of reconnecting each time.
+# Whoever owns a loop calls close_http_session() on it before discarding it
+_HTTP_SESSIONS: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+async def _get_http_session() -> aiohttp.ClientSession:
+    loop = asyncio.get_running_loop()
+    session = _HTTP_SESSIONS.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=32, keepalive_timeout=60, ttl_dns_cache=300)
+        session = _HTTP_SESSIONS[loop] = aiohttp.ClientSession(connector=connector)
+    return session
+
+async def close_http_session():
+    """Close the running loop's pooled HTTP session, if it has one"""
+    session = _HTTP_SESSIONS.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+@atexit.register
+def _close_http_sessions():
+    for loop, session in list(_HTTP_SESSIONS.items()):
+        if not session.closed and not loop.is_closed() and not loop.is_running():
+            loop.run_until_complete(session.close())
+
+# Share of the user prompt's words that Groq's image prompt must keep for the
+# speculatively generated image to be used. Measured against the user prompt only,
+# since the refined prompt is meant to be much longer and more detailed
+SPECULATIVE_IMAGE_MIN_OVERLAP = 0.6
+_PROMPT_WORD_RE = re.compile(r"[a-z0-9]{3,}")
+
+def _prompt_overlap(prompt: str, image_prompt: str) -> float:
+    words = set(_PROMPT_WORD_RE.findall(prompt.lower()))
+    if not words:
+        return 0.0
+    return len(words & set(_PROMPT_WORD_RE.findall(image_prompt.lower()))) / len(words)
+
+# Most bulk DMs queued on the instagrapi worker at once
+BULK_DM_CONCURRENCY = 4
+
+# Newly resolved user ids are written to the session file at most this often (seconds)
+UID_CACHE_SAVE_INTERVAL = 10
+
+# A saved session that passed the timeline probe is trusted for this many seconds
+SESSION_PROBE_TTL = 300
+# (username, settings file mtime) -> monotonic time the saved session last passed the
+# probe. Process-wide so every browser session logging in from the same saved session
+# shares it; rewriting the settings file changes the key
+_VALIDATED_SESSIONS: Dict[Tuple[str, int], float] = {}
+
+# post URL -> media id, shared by every bot; least recently used entries are evicted first.
+# Each Streamlit session runs its own loop on its own script thread, hence the lock
+_MEDIA_ID_CACHE: "OrderedDict[str, str]" = OrderedDict()
+_MEDIA_ID_CACHE_LOCK = threading.Lock()
+_MEDIA_ID_CACHE_MAX_ENTRIES = 1024
+
+# Natural-language commands: a leading verb picks the parser for the rest of the text
+_COMMAND_RE = re.compile(r"^\s*(?P<verb>send|post|create|like|comment|follow|unfollow)\b(?P<rest>.*)$", re.I | re.S)
+_SEND_RE = re.compile(r"^\s*(?P<message>.+)\s+to\s+(?P<username>\S+)\s*$", re.I | re.S)
+_COMMENT_RE = re.compile(r"^\s*(?P<comment_text>.+)\s+on\s+(?P<post_url>\S+)\s*$", re.I | re.S)
+
+def _parse_send(prompt: str, rest: str) -> Optional[Dict]:
+    m = _SEND_RE.match(rest)
+    if not m:
+        return None
+    return {
+        "action": "message",
+        "details": {
+            "username": m["username"],
+            "message": m["message"].strip()
+        }
+    }
+
+def _parse_post(prompt: str, rest: str) -> Optional[Dict]:
+    return {
+        "action": "post",
+        "details": {
+            "caption": prompt,
+            "image_prompt": prompt
+        }
+    }
+
+def _parse_like(prompt: str, rest: str) -> Optional[Dict]:
+    url = rest.strip()
+    if not url:
+        return None
+    return {
+        "action": "like",
+        "details": {
+            "post_url": url
+        }
+    }
+
+def _parse_comment(prompt: str, rest: str) -> Optional[Dict]:
+    m = _COMMENT_RE.match(rest)
+    if not m:
+        return None
+    return {
+        "action": "comment",
+        "details": {
+            "post_url": m["post_url"],
+            "comment_text": m["comment_text"].strip()
+        }
+    }
+
+def _parse_follow(prompt: str, rest: str) -> Optional[Dict]:
+    username = rest.strip()
+    if not username:
+        return None
+    return {
+        "action": "follow",
+        "details": {
+            "username": username
+        }
+    }
+
+def _parse_unfollow(prompt: str, rest: str) -> Optional[Dict]:
+    username = rest.strip()
+    if not username:
+        return None
+    return {
+        "action": "unfollow",
+        "details": {
+            "username": username
+        }
+    }
+
+_COMMAND_PARSERS: Dict[str, Callable[[str, str], Optional[Dict]]] = {
+    "send": _parse_send,
+    "post": _parse_post,
+    "create": _parse_post,
+    "like": _parse_like,
+    "comment": _parse_comment,
+    "follow": _parse_follow,
+    "unfollow": _parse_unfollow,
+}
 
 class AIAssistant:
     @staticmethod
     async def process_command(prompt: str) -> Dict:
         try:
-            # First, analyze the command type
-            command_lower = prompt.lower()
-            
-            # Handle message commands
-            if "send" in command_lower and "to" in command_lower:
-                try:
-                    # Extract username and message
-                    parts = prompt.split("to", 1)
-                    message = parts[0].replace("send", "").strip()
-                    username = parts[1].strip()
-                    return {
-                        "action": "message",
-                        "details": {
-                            "username": username,
-                            "message": message
-                        }
-                    }
-                except Exception:
-                    logger.error("Failed to parse message command")
-                    return None
-
-            # Handle post commands
-            elif "post" in command_lower or "create" in command_lower:
-                return {
-                    "action": "post",
-                    "details": {
-                        "caption": prompt,
-                        "image_prompt": prompt
-                    }
-                }
-
-            # Handle like commands
-            elif "like" in command_lower:
-                try:
-                    url = prompt.split("like", 1)[1].strip()
-                    return {
-                        "action": "like",
-                        "details": {
-                            "post_url": url
-                        }
-                    }
-                except Exception:
-                    logger.error("Failed to parse like command")
-                    return None
-
-            # Handle comment commands
-            elif "comment" in command_lower:
-                try:
-                    parts = prompt.split("comment", 1)[1].strip().split("on", 1)
-                    comment_text = parts[0].strip()
-                    post_url = parts[1].strip()
-                    return {
-                        "action": "comment",
-                        "details": {
-                            "post_url": post_url,
-                            "comment_text": comment_text
-                        }
-                    }
-                except Exception:
-                    logger.error("Failed to parse comment command")
-                    return None
-
-            # Handle follow commands
-            elif "follow" in command_lower:
-                try:
-                    username = prompt.split("follow", 1)[1].strip()
-                    return {
-                        "action": "follow",
-                        "details": {
-                            "username": username
-                        }
-                    }
-                except Exception:
-                    logger.error("Failed to parse follow command")
-                    return None
-
-            # Handle unfollow commands
-            elif "unfollow" in command_lower:
-                try:
-                    username = prompt.split("unfollow", 1)[1].strip()
-                    return {
-                        "action": "unfollow",
-                        "details": {
-                            "username": username
-                        }
-                    }
-                except Exception:
-                    logger.error("Failed to parse unfollow command")
-                    return None
-
-            else:
-                logger.error(f"Unknown command type: {prompt}")
+            m = _COMMAND_RE.match(prompt)
+            if not m:
+                logger.error("Unknown command type: %s", prompt)
                 return None
 
+            verb = m["verb"].lower()
+            result = _COMMAND_PARSERS[verb](prompt, m["rest"])
+            if result is None:
+                logger.error("Failed to parse %s command", verb)
+            return result
+
         except Exception as e:
-            logger.error(f"Error processing command: {e}")
+            logger.error("Error processing command: %s", e)
             return None
 
 class ContentGenerator:
     @staticmethod
-    async def generate_content(prompt: str) -> Tuple[str, str]:
+    async def generate_content(prompt: str, generation: int = 0) -> Tuple[str, str]:
         try:
-            system_prompt = """Create Instagram content. Respond with JSON only:
-            {
-                "caption": "Instagram caption with hashtags",
-                "image_prompt": "detailed image generation prompt"
-            }"""
-
-            response = await groq_client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                model="meta-llama/llama-4-scout-17b-16e-instruct"
-            )
-
-            response_text = response.choices[0].message.content.strip()
-            response_text = response_text.replace('```json\n', '').replace('```', '')
-            
-            content = json.loads(response_text)
-            return content["caption"], content["image_prompt"]
+            return await _to_thread_with_script_ctx(_generate_content_cached, prompt, generation)
 
         except Exception as e:
-            logger.error(f"Content generation error: {e}")
+            logger.error("Content generation error: %s", e)
             return None, None
 
     @staticmethod
-    async def generate_image(prompt: str) -> Optional[str]:
+    def _image_cache_path(prompt: str, generation: int) -> Path:
+        key = prompt if generation == 0 else f"{prompt}\0{generation}"
+        return IMAGE_CACHE_DIR / f"{hashlib.sha256(key.encode()).hexdigest()}.jpg"
+
+    @staticmethod
+    def _shrink_for_upload(path: str):
+        with Image.open(path) as image:
+            image.load()
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail(UPLOAD_MAX_SIZE, Image.LANCZOS)
+        image.save(path, 'JPEG', quality=85, optimize=True, progressive=True)
+
+    @staticmethod
+    def _commit_cached_image(temp_path: str, path: Path) -> str:
+        try:
+            # Re-encode once on download, so cache hits are never recompressed again
+            ContentGenerator._shrink_for_upload(temp_path)
+            # Downloads land in a temp file first so a half-written image is never a cache hit
+            os.replace(temp_path, path)
+        except BaseException:
+            # e.g. an error page or truncated body that PIL can't decode
+            os.unlink(temp_path)
+            raise
+
+        # mtime is the download time (for the TTL), atime the last use (for LRU eviction)
+        last_used = {}
+        for entry in IMAGE_CACHE_DIR.glob('*.jpg'):
+            try:
+                last_used[entry] = entry.stat().st_atime
+            except FileNotFoundError:
+                pass
+        for stale in sorted(last_used, key=last_used.get)[:-IMAGE_CACHE_MAX_ENTRIES]:
+            stale.unlink(missing_ok=True)
+        return str(path)
+
+    @staticmethod
+    def _lookup_cached_image(path: Path) -> Optional[str]:
+        try:
+            stat = path.stat()
+            if time.time() - stat.st_mtime > IMAGE_CACHE_TTL:
+                return None
+            os.utime(path, times=(time.time(), stat.st_mtime))
+            return str(path)
+        except FileNotFoundError:
+            # Missing or evicted by another session in the meantime
+            return None
+
+    @staticmethod
+    def _checkout_cached_image(path: str) -> str:
+        fd, private_path = tempfile.mkstemp(suffix='.jpg')
+        os.close(fd)
         try:
+            shutil.copyfile(path, private_path)
+        except BaseException:
+            os.unlink(private_path)
+            raise
+        return private_path
+
+    @staticmethod
+    async def checkout_image(path: str) -> str:
+        """Copy a cache entry returned by generate_image into a private temp file.
+
+        Callers delete the copy when they are done with it, which must not take
+        the shared entry (or another session's preview) with it. Only check out
+        an image that will actually be used, so abandoned renders leave no copies.
+        """
+        return await asyncio.to_thread(ContentGenerator._checkout_cached_image, path)
+
+    @staticmethod
+    async def generate_image(prompt: str, generation: int = 0) -> Optional[str]:
+        try:
+            cache_path = ContentGenerator._image_cache_path(prompt, generation)
+            cached_path = await asyncio.to_thread(ContentGenerator._lookup_cached_image, cache_path)
+            if cached_path:
+                return cached_path
+
             encoded_prompt = urllib.parse.quote(prompt)
             image_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}"
+            if generation:
+                # Same prompt renders the same image unless the seed changes
+                image_url += f"?seed={generation}"
             
-            response = requests.get(image_url)
-            response.raise_for_status()
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                temp_file.write(response.content)
-                return temp_file.name
+            IMAGE_CACHE_DIR.mkdir(exist_ok=True)
+            session = await _get_http_session()
+            # Stream straight to disk so the body is never buffered whole in memory;
+            # 64 KiB page-cache writes are cheap enough to stay on the loop
+            with tempfile.NamedTemporaryFile(dir=IMAGE_CACHE_DIR, delete=False, suffix='.tmp') as temp_file:
+                try:
+                    async with session.get(image_url) as response:
+                        response.raise_for_status()
+                        async for chunk in response.content.iter_chunked(65536):
+                            temp_file.write(chunk)
+                except BaseException:
+                    temp_file.close()
+                    os.unlink(temp_file.name)
+                    raise
+
+            return await asyncio.to_thread(ContentGenerator._commit_cached_image, temp_file.name, cache_path)
 
         except Exception as e:
-            logger.error(f"Image generation error: {e}")
+            logger.error("Image generation error: %s", e)
             return None
 
+# instagrapi runs in a worker process so its blocking HTTP and session handling
+# never stalls the UI process; each worker owns a single Client built on first use
+_worker_client: Optional[Client] = None
+
+def _dispatch(method: str, *args) -> Any:
+    global _worker_client
+    if _worker_client is None:
+        _worker_client = Client()
+    return getattr(_worker_client, method)(*args)
+
+def _new_worker_pool() -> ProcessPoolExecutor:
+    # A single worker keeps every call on the same Client state. Spawn rather than
+    # fork: the pool starts from a Streamlit script thread in a multithreaded process
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
 class InstagramBot:
     def __init__(self):
-        self.client = Client()
+        # Cheap to build: the executor only starts its worker process on the first
+        # Client call, so a session that never logs in never spawns one
+        self._pool = _new_worker_pool()
         self.logged_in = False
         self.username = None
         self.session_file = 'session.json'
         self.settings_file = 'instagram_settings.json'
+        # username -> user id; ids never change, so this lives for the whole session
+        self._uid_cache: Dict[str, str] = {}
+        self._uid_cache_dirty = False
+        self._uid_cache_saved_at = 0.0
         self.content_generator = ContentGenerator()
         self.ai_assistant = AIAssistant()
 
+    async def _call(self, method: str, *args) -> Any:
+        """Run a Client method in the instagrapi worker process"""
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            return await loop.run_in_executor(pool, _dispatch, method, *args)
+        except BrokenProcessPool:
+            if self._pool is not pool:
+                # A concurrent call already replaced the dead pool
+                raise
+            # The worker died (OOM, crash, unpicklable result); the call still fails,
+            # but replace the pool and restore the saved session so later calls work
+            logger.error("instagrapi worker died during %s, restarting it", method)
+            pool.shutdown(wait=False)
+            self._pool = _new_worker_pool()
+            if os.path.exists(self.settings_file):
+                await loop.run_in_executor(self._pool, _dispatch, "load_settings", self.settings_file)
+            raise
+
+    def _validated_session_key(self) -> Optional[Tuple[str, int]]:
+        try:
+            return self.username, os.stat(self.settings_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _mark_session_validated(self):
+        key = self._validated_session_key()
+        if key is None:
+            return
+        now = time.monotonic()
+        for stale, validated_at in list(_VALIDATED_SESSIONS.items()):
+            if now - validated_at >= SESSION_PROBE_TTL:
+                _VALIDATED_SESSIONS.pop(stale, None)
+        _VALIDATED_SESSIONS[key] = now
+
     async def save_session(self):
         try:
-            self.client.dump_settings(self.settings_file)
-            session_data = {
-                'username': self.username,
-                'logged_in': self.logged_in
-            }
-            with open(self.session_file, 'w') as f:
-                json.dump(session_data, f)
+            await self._call("dump_settings", self.settings_file)
+            await self._write_session_file()
             logger.info("Session saved successfully")
         except Exception as e:
-            logger.error(f"Failed to save session: {e}")
+            logger.error("Failed to save session: %s", e)
+
+    async def _write_session_file(self):
+        # Snapshot on the loop, then write off it; concurrent bulk actions can both
+        # flush, so the write goes through a temp file to never leave a torn file
+        data = orjson.dumps({
+            'username': self.username,
+            'logged_in': self.logged_in,
+            'uid_cache': self._uid_cache
+        })
+        self._uid_cache_dirty = False
+        self._uid_cache_saved_at = time.monotonic()
+        await asyncio.to_thread(_write_file_atomic, self.session_file, data)
+
+    async def _save_uid_cache(self, force: bool = False):
+        """Persist newly resolved user ids, throttled to one write per UID_CACHE_SAVE_INTERVAL"""
+        if not self._uid_cache_dirty or not self.logged_in:
+            return
+        if not force and time.monotonic() - self._uid_cache_saved_at < UID_CACHE_SAVE_INTERVAL:
+            return
+        try:
+            await self._write_session_file()
+        except Exception as e:
+            logger.error("Failed to save user id cache: %s", e)
 
     async def load_session(self) -> bool:
         try:
             if os.path.exists(self.settings_file) and os.path.exists(self.session_file):
-                self.client.load_settings(self.settings_file)
-                with open(self.session_file, 'r') as f:
-                    session_data = json.load(f)
+                await self._call("load_settings", self.settings_file)
+                session_data = orjson.loads(await asyncio.to_thread(Path(self.session_file).read_bytes))
                 self.username = session_data.get('username')
                 self.logged_in = session_data.get('logged_in', False)
+                self._uid_cache.update(session_data.get('uid_cache', {}))
+                validated_at = _VALIDATED_SESSIONS.get(self._validated_session_key())
+                if validated_at is not None and time.monotonic() - validated_at < SESSION_PROBE_TTL:
+                    logger.info("Session loaded successfully")
+                    return True
                 try:
-                    self.client.get_timeline_feed()
+                    await self._call("get_timeline_feed")
+                    self._mark_session_validated()
                     logger.info("Session loaded successfully")
                     return True
                 except Exception:
                     logger.info("Saved session expired")
                     return False
         except Exception as e:
-            logger.error(f"Failed to load session: {e}")
+            logger.error("Failed to load session: %s", e)
         return False
 
     async def login(self, username: str, password: str) -> bool:
         try:
             if await self.load_session():
-                console.print("[green]Logged in using saved session[/green]")
+                if logger.isEnabledFor(logging.INFO):
+                    console.print("[green]Logged in using saved session[/green]")
                 return True
 
-            self.client.login(username, password)
+            await self._call("login", username, password)
             self.logged_in = True
             self.username = username
             await self.save_session()
+            self._mark_session_validated()
             return True
         except Exception as e:
-            logger.error(f"Login failed: {e}")
+            logger.error("Login failed: %s", e)
             return False
 
     async def logout(self):
         try:
-            self.client.logout()
+            # Forget the validation first, so a logout that fails halfway forces a re-probe
+            for key in list(_VALIDATED_SESSIONS):
+                if key[0] == self.username:
+                    _VALIDATED_SESSIONS.pop(key, None)
+            await self._call("logout")
             self.logged_in = False
             self.username = None
             for file in [self.session_file, self.settings_file]:
-                if os.path.exists(file):
-                    os.remove(file)
-            console.print("[green]Logged out successfully[/green]")
+                _safe_unlink(file)
+            if logger.isEnabledFor(logging.INFO):
+                console.print("[green]Logged out successfully[/green]")
         except Exception as e:
-            logger.error(f"Logout error: {e}")
+            logger.error("Logout error: %s", e)
 
     async def process_natural_command(self, command: str) -> bool:
         try:
-            console.print(f"[blue]Processing command: {command}[/blue]")
+            if logger.isEnabledFor(logging.DEBUG):
+                console.print(f"[blue]Processing command: {command}[/blue]")
             action_data = await self.ai_assistant.process_command(command)
             
             if not action_data:
@@ -259,7 +547,8 @@ class InstagramBot:
             action = action_data["action"]
             details = action_data["details"]
 
-            console.print(f"[blue]Executing action: {action}[/blue]")
+            if logger.isEnabledFor(logging.DEBUG):
+                console.print(f"[blue]Executing action: {action}[/blue]")
 
             if action == "post":
                 return await self.create_ai_post(details.get("caption", command))
@@ -278,74 +567,136 @@ class InstagramBot:
                 return False
 
         except Exception as e:
-            logger.error(f"Error processing command: {e}")
+            logger.error("Error processing command: %s", e)
             return False
 
     # In instagram_bot.py, modify the create_ai_post method:
 
-    async def create_ai_post(self, prompt: str) -> tuple:
+    async def create_ai_post(self, prompt: str, generation: int = 0) -> tuple:
+        """Generate a caption and image for prompt; a higher generation asks for a new version"""
+        # Start rendering the raw prompt while Groq refines it; cancelled if the refinement drifts
+        image_task = asyncio.create_task(self.content_generator.generate_image(prompt, generation))
+        image_path = None
         try:
-            caption, image_prompt = await self.content_generator.generate_content(prompt)
+            caption, image_prompt = await self.content_generator.generate_content(prompt, generation)
             if not caption or not image_prompt:
                 return False, None, None
 
-            image_path = await self.content_generator.generate_image(image_prompt)
+            if _prompt_overlap(prompt, image_prompt) >= SPECULATIVE_IMAGE_MIN_OVERLAP:
+                image_path = await image_task
+            if not image_path:
+                image_task.cancel()
+                image_path = await self.content_generator.generate_image(image_prompt, generation)
             if not image_path:
                 return False, None, None
+            image_path = await self.content_generator.checkout_image(image_path)
 
             # Return a tuple of success status, image path, and caption
             return True, image_path, caption
 
         except Exception as e:
-            logger.error(f"Error creating AI post: {e}")
+            logger.error("Error creating AI post: %s", e)
             return False, None, None
+        finally:
+            # Let a cancelled download unwind now rather than on this session's next rerun
+            image_task.cancel()
+            await asyncio.gather(image_task, return_exceptions=True)
+
+    async def _resolve_user_id(self, username: str) -> str:
+        user_id = self._uid_cache.get(username)
+        if user_id is None:
+            user_id = await self._call("user_id_from_username", username)
+            self._uid_cache[username] = user_id
+            self._uid_cache_dirty = True
+        # Also flushes ids left over from an earlier throttled write
+        await self._save_uid_cache()
+        return user_id
+
+    async def _resolve_and_act(self, username: str, action: Callable[[str], Awaitable[Any]]) -> Any:
+        user_id = await self._resolve_user_id(username)
+        return await action(user_id)
+
+    async def upload_photo(self, image_path: str, caption: str):
+        return await self._call("photo_upload", image_path, caption)
 
     async def send_dm(self, username: str, message: str) -> bool:
         try:
-            user_id = self.client.user_id_from_username(username)
-            self.client.direct_send(message, [user_id])
-            console.print(f"[green]Message sent to {username}![/green]")
+            await self._resolve_and_act(
+                username, lambda user_id: self._call("direct_send", message, [user_id])
+            )
+            if logger.isEnabledFor(logging.INFO):
+                console.print(f"[green]Message sent to {username}![/green]")
             return True
         except Exception as e:
-            logger.error(f"Error sending DM: {e}")
+            logger.error("Error sending DM: %s", e)
             return False
 
+    async def send_dms(self, pairs: List[Tuple[str, str]]) -> List[bool]:
+        # The single worker runs Client calls one at a time; the semaphore only bounds
+        # how many sends are queued on it so a large batch doesn't flood the executor
+        semaphore = asyncio.Semaphore(BULK_DM_CONCURRENCY)
+
+        async def send_one(username: str, message: str) -> bool:
+            async with semaphore:
+                return await self.send_dm(username, message)
+
+        results = await asyncio.gather(*[send_one(username, message) for username, message in pairs])
+        await self._save_uid_cache(force=True)
+        return results
+
+    async def _resolve_media_id(self, post_url: str) -> str:
+        with _MEDIA_ID_CACHE_LOCK:
+            media_id = _MEDIA_ID_CACHE.get(post_url)
+            if media_id is not None:
+                _MEDIA_ID_CACHE.move_to_end(post_url)
+                return media_id
+
+        media_pk = await self._call("media_pk_from_url", post_url)
+        media_id = await self._call("media_id", media_pk)
+        with _MEDIA_ID_CACHE_LOCK:
+            _MEDIA_ID_CACHE[post_url] = media_id
+            if len(_MEDIA_ID_CACHE) > _MEDIA_ID_CACHE_MAX_ENTRIES:
+                _MEDIA_ID_CACHE.popitem(last=False)
+        return media_id
+
     async def like_post(self, post_url: str) -> bool:
         try:
-            media_id = self.client.media_id(self.client.media_pk_from_url(post_url))
-            self.client.media_like(media_id)
-            console.print("[green]Post liked successfully![/green]")
+            media_id = await self._resolve_media_id(post_url)
+            await self._call("media_like", media_id)
+            if logger.isEnabledFor(logging.INFO):
+                console.print("[green]Post liked successfully![/green]")
             return True
         except Exception as e:
-            logger.error(f"Error liking post: {e}")
+            logger.error("Error liking post: %s", e)
             return False
 
     async def comment_on_post(self, post_url: str, comment: str) -> bool:
         try:
-            media_id = self.client.media_id(self.client.media_pk_from_url(post_url))
-            self.client.media_comment(media_id, comment)
-            console.print("[green]Comment posted successfully![/green]")
+            media_id = await self._resolve_media_id(post_url)
+            await self._call("media_comment", media_id, comment)
+            if logger.isEnabledFor(logging.INFO):
+                console.print("[green]Comment posted successfully![/green]")
             return True
         except Exception as e:
-            logger.error(f"Error commenting: {e}")
+            logger.error("Error commenting: %s", e)
             return False
 
     async def follow_user(self, username: str) -> bool:
         try:
-            user_id = self.client.user_id_from_username(username)
-            self.client.user_follow(user_id)
-            console.print(f"[green]Now following {username}![/green]")
+            await self._resolve_and_act(username, partial(self._call, "user_follow"))
+            if logger.isEnabledFor(logging.INFO):
+                console.print(f"[green]Now following {username}![/green]")
             return True
         except Exception as e:
-            logger.error(f"Error following user: {e}")
+            logger.error("Error following user: %s", e)
             return False
 
     async def unfollow_user(self, username: str) -> bool:
         try:
-            user_id = self.client.user_id_from_username(username)
-            self.client.user_unfollow(user_id)
-            console.print(f"[green]Unfollowed {username}![/green]")
+            await self._resolve_and_act(username, partial(self._call, "user_unfollow"))
+            if logger.isEnabledFor(logging.INFO):
+                console.print(f"[green]Unfollowed {username}![/green]")
             return True
         except Exception as e:
-            logger.error(f"Error unfollowing user: {e}")
+            logger.error("Error unfollowing user: %s", e)
             return False
\ No newline at end of file